@@ -5,11 +5,13 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from pymongo import MongoClient, WriteConcern
+from bson import ObjectId
+from bson.codec_options import TypeDecoder, TypeRegistry
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,9 +24,29 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # connect=False defers connecting until first use, so processes that merely
+    # import this module (e.g. extraction pool children) never open sockets
+    _client = MongoClient(database_url, connect=False)
     db = _client[database_name]
 
+class _ObjectIdAsStr(TypeDecoder):
+    """Decode ObjectId straight to str inside pymongo's BSON decoder"""
+    bson_type = ObjectId
+
+    def transform_bson(self, value):
+        return str(value)
+
+# Codec options for read helpers whose results go straight back out as JSON
+_STR_ID_CODEC_OPTIONS = db.codec_options.with_options(type_registry=TypeRegistry([_ObjectIdAsStr()])) if db is not None else None
+
+def ensure_indexes():
+    """Create indexes backing the per-project listing and tag-index/BOM aggregations"""
+    if db is None:
+        return
+
+    db.extractionitem.create_index([("project_id", 1), ("kind", 1), ("label", 1)])
+    db.upload.create_index([("project_id", 1)])
+
 # Helper functions for common database operations
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
@@ -43,13 +65,56 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     result = db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+def create_documents(collection_name: str, data: List[Union[BaseModel, dict]], write_concern: WriteConcern = None):
+    """Insert many documents with timestamps in a single round-trip, optionally with a relaxed write concern"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for item in data:
+        doc = item.model_dump() if isinstance(item, BaseModel) else item.copy()
+        doc['created_at'] = now
+        doc['updated_at'] = now
+        docs.append(doc)
+
+    if not docs:
+        return []
+
+    collection = db[collection_name]
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+    result = collection.insert_many(docs, ordered=False)
+    return [str(i) for i in result.inserted_ids]
+
+def update_document(collection_name: str, document_id: str, data: dict):
+    """Set fields on a single document by id, refreshing its timestamp"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    update = dict(data, updated_at=datetime.now(timezone.utc))
+    result = db[collection_name].update_one({"_id": ObjectId(document_id)}, {"$set": update})
+    return result.modified_count
+
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None,
+                  skip: int = 0, batch_size: int = 200):
+    """Get documents from collection (ObjectIds as str), optionally projecting only some fields and paging with skip/limit"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    # ObjectIds (including _id) come back as str via _STR_ID_CODEC_OPTIONS
+    collection = db.get_collection(collection_name, codec_options=_STR_ID_CODEC_OPTIONS)
+    cursor = collection.find(filter_dict or {}, projection).batch_size(batch_size)
+    if skip:
+        cursor = cursor.skip(skip)
     if limit:
         cursor = cursor.limit(limit)
     
     return list(cursor)
+
+def aggregate_documents(collection_name: str, pipeline: List[dict]):
+    """Run an aggregation pipeline server-side and return the results"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return list(db[collection_name].aggregate(pipeline))
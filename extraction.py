@@ -0,0 +1,40 @@
+"""
+Deterministic Tag Extraction (MVP)
+
+Runs inside the extraction process pool, so it must stay free of database and
+app imports: pool children unpickle `extract_tags` by importing this module.
+"""
+
+import re
+from typing import List
+
+try:  # Optional DFA engine (google-re2); RE2 has no backtracking and \b/\d are ASCII-only
+    import re2
+except ImportError:
+    re2 = None
+
+# Additional filename patterns (equipment codes, line numbers) should be added
+# as alternatives in this single compiled regex rather than scanned separately.
+# Case-insensitive classes so only matched slices are uppercased, not the whole filename
+_TAG_REGEX = r"\b([A-Za-z]{1,3}-?\d{1,4}[A-Za-z]?)\b"  # e.g., P-101, V203, LT-101A
+TAG_PATTERN = re2.compile(_TAG_REGEX) if re2 is not None else re.compile(_TAG_REGEX, re.ASCII)
+
+
+def _is_word_char(ch: str) -> bool:
+    # Same test as stdlib re's Unicode-aware \w
+    return ch.isalnum() or ch == "_"
+
+
+def _unicode_bounded(text: str, start: int, end: int) -> bool:
+    # TAG_PATTERN's \b is ASCII-only (re.ASCII / RE2), so non-ASCII letters count
+    # as boundaries: "straße-12" would yield E-12 and "éP-101" P-101. Reject
+    # matches glued to a Unicode word character, as a Unicode \b would.
+    return not (start and _is_word_char(text[start - 1])) and not (end < len(text) and _is_word_char(text[end]))
+
+
+def extract_tags(path: str, filename: str) -> List[str]:
+    # MVP extraction: scan filename for tag-like strings, deduplicated in order.
+    # `path` is where content-based extraction will read the stored file.
+    return list(dict.fromkeys(
+        m.group(1).upper() for m in TAG_PATTERN.finditer(filename) if _unicode_bounded(filename, *m.span(1))
+    ))
@@ -1,16 +1,62 @@
 import os
+import sys
+import time
+import logging
+import threading
+import asyncio
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
-from database import db, create_document, get_documents
-from pydantic import BaseModel
+from database import (
+    db, create_document, create_documents, update_document, get_documents, aggregate_documents, ensure_indexes
+)
+from extraction import extract_tags
+from pymongo import WriteConcern
+from pydantic import BaseModel, ConfigDict
 
-import re
+import shutil
 import uuid
 
-app = FastAPI(title="OG Drawing Intelligence API", version="0.1.0")
+
+logger = logging.getLogger(__name__)
+
+
+def _ensure_indexes_logged():
+    try:
+        ensure_indexes()
+    except Exception:
+        logger.exception("Could not create MongoDB indexes")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    # Not awaited: with Mongo unreachable create_index blocks for the full
+    # server-selection timeout (30 s), longer than gunicorn's worker timeout.
+    # A daemon thread lets startup finish immediately; /test reports the outage.
+    threading.Thread(target=_ensure_indexes_logged, name="ensure-indexes", daemon=True).start()
+    app.state.extraction_pool = ProcessPoolExecutor(
+        max_workers=EXTRACTION_WORKERS, mp_context=EXTRACTION_MP_CONTEXT
+    )
+    yield
+    # Uploads already got a 202, so let queued extraction finish
+    app.state.extraction_pool.shutdown(wait=True)
+
+
+app = FastAPI(
+    title="OG Drawing Intelligence API",
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +72,17 @@ def read_root():
     return {"message": "Oil & Gas Drawing Intelligence API is running"}
 
 
+DATABASE_URL_SET = bool(os.getenv("DATABASE_URL"))
+DATABASE_NAME = os.getenv("DATABASE_NAME")
+COLLECTIONS_CACHE_TTL = 5  # seconds
+
+
+@lru_cache(maxsize=1)
+def _cached_collection_names(bucket: int) -> tuple:
+    # `bucket` changes every COLLECTIONS_CACHE_TTL seconds, expiring the entry
+    return tuple(db.list_collection_names()[:10])
+
+
 @app.get("/test")
 def test_database():
     response = {
@@ -39,11 +96,11 @@ def test_database():
     try:
         if db is not None:
             response["database"] = "✅ Available"
-            response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-            response["database_name"] = os.getenv("DATABASE_NAME") or "❌ Not Set"
+            response["database_url"] = "✅ Set" if DATABASE_URL_SET else "❌ Not Set"
+            response["database_name"] = DATABASE_NAME or "❌ Not Set"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                bucket = int(time.monotonic() // COLLECTIONS_CACHE_TTL)
+                response["collections"] = list(_cached_collection_names(bucket))
                 response["database"] = "✅ Connected & Working"
                 response["connection_status"] = "Connected"
             except Exception as e:
@@ -57,25 +114,100 @@ def test_database():
 
 # Simple in-app storage path (ephemeral). In real deployments, use object storage.
 STORAGE_DIR = "./uploads"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB per copy keeps memory bounded for large drawings
+# Like shutil: only Linux sendfile accepts a regular file as the output fd
+# (macOS/BSD require a socket there).
+_USE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+
+def persist_upload(src, path: str) -> int:
+    """Copy the spooled upload to `path` and return its size in bytes"""
+    size = src.seek(0, os.SEEK_END)
+    src.seek(0)
+    with open(path, "wb") as dst:
+        # Spilled spools are real files: copy kernel-side. fileno() on an in-memory
+        # spool would force a rollover, so check SpooledTemporaryFile._rolled first.
+        # It is private but has existed unchanged in every CPython 3.x release
+        # (through 3.13); if it ever goes away getattr() falls back to copyfileobj.
+        if _USE_SENDFILE and getattr(src, "_rolled", False):
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                if not sent:
+                    raise OSError(f"sendfile stopped at {offset} of {size} bytes writing {path}")
+                offset += sent
+        else:
+            shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+    return size
+
+
+# Relaxed write concern for extraction items only; they are reproducible from the
+# stored file. What w=1, j=False actually changes depends on the deployment:
+# - Standalone server: nothing. w=1 already acknowledges without waiting for the
+#   journal, so j=False is a no-op there.
+# - Replica set on MongoDB 5.0+: the implicit default is w:"majority", so this
+#   also drops majority acknowledgement. Items acknowledged only by the primary
+#   can be rolled back on failover.
+# Projects and uploads are authoritative and keep the default write concern.
+EXTRACTION_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Worker processes for compute-bound extraction (filename scan today, PDF/DXF parsing later).
+# The pool is per web worker: total processes = WEB_CONCURRENCY * (1 + EXTRACTION_WORKERS),
+# e.g. 9 * 3 = 27 on a 4-CPU host with the defaults. Lower either when running many workers.
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", 2))
+# Spawn, not fork: forking a threaded process that holds a live MongoClient is
+# unsafe. Children only need the `extraction` module; under uvicorn/gunicorn they
+# never import this one, and with `python main.py` they re-import it as
+# __mp_main__ without running lifespan or touching the (lazy) MongoClient.
+EXTRACTION_MP_CONTEXT = multiprocessing.get_context("spawn")
 
 
 # ---------- Utility extraction functions (deterministic MVP) ----------
-TAG_PATTERN = re.compile(r"\b([A-Z]{1,3}-?\d{1,4}[A-Z]?)\b")  # e.g., P-101, V203, LT-101A
+_EXT_MAP = MappingProxyType({
+    "pdf": "pdf", "dxf": "dxf", "dwg": "dwg", "tiff": "tiff",
+    "tif": "tiff", "step": "step", "stp": "step", "ifc": "ifc",
+    "obj": "obj", "nwd": "nwd", "nwc": "nwc"
+})
 
 
 def guess_filetype(filename: str) -> str:
-    ext = filename.split(".")[-1].lower()
-    mapping = {
-        "pdf": "pdf", "dxf": "dxf", "dwg": "dwg", "tiff": "tiff",
-        "tif": "tiff", "step": "step", "stp": "step", "ifc": "ifc",
-        "obj": "obj", "nwd": "nwd", "nwc": "nwc"
-    }
-    return mapping.get(ext, "other")
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return _EXT_MAP.get(ext, "other")
+
+
+async def _extract_and_store(path: str, filename: str, upload_id: str, project_id: str):
+    loop = asyncio.get_running_loop()
+    try:
+        found_tags = await loop.run_in_executor(app.state.extraction_pool, extract_tags, path, filename)
+        items = [
+            {
+                "project_id": project_id,
+                "upload_id": upload_id,
+                "kind": "tag",
+                "label": tag,
+                "attributes": {"source": "filename"},
+                "page": None,
+                "confidence": 0.4,
+            }
+            for tag in found_tags
+        ]
+        if items:
+            await run_in_threadpool(create_documents, "extractionitem", items, EXTRACTION_WRITE_CONCERN)
+        status = {"extraction_status": "done", "extraction_count": len(items)}
+    except Exception as e:
+        logger.exception("Extraction failed for upload %s", upload_id)
+        status = {"extraction_status": "failed", "extraction_error": str(e)[:200]}
+
+    try:
+        await run_in_threadpool(update_document, "upload", upload_id, status)
+    except Exception:
+        logger.exception("Could not record extraction status for upload %s", upload_id)
 
 
 # ---------- API Models ----------
 class ProjectCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     name: str
     code: Optional[str] = None
     description: Optional[str] = None
@@ -83,6 +215,8 @@ class ProjectCreate(BaseModel):
 
 
 class DocumentRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     project_id: str
     doc_type: str  # tag-index | bom | summary
 
@@ -95,29 +229,26 @@ def create_project(payload: ProjectCreate):
 
 
 @app.get("/api/projects")
-def list_projects():
-    items = get_documents("project", {}, limit=100)
-    # Normalize ObjectId to str if present (db helper returns raw docs)
-    for it in items:
-        if "_id" in it:
-            it["_id"] = str(it["_id"])
-    return {"projects": items}
+def list_projects(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    items = get_documents("project", {}, skip=skip, limit=limit)
+    # get_documents already decodes ObjectIds to str, so the docs can go straight
+    # to orjson, bypassing FastAPI's jsonable_encoder pass
+    return ORJSONResponse({"projects": items})
 
 
-@app.post("/api/uploads")
+@app.post("/api/uploads", status_code=202)
 async def upload_file(
+    background: BackgroundTasks,
     project_id: str = Form(...),
     file: UploadFile = File(...)
 ):
     # Persist file to local storage
-    fid = str(uuid.uuid4())
+    fid = uuid.uuid4().hex
     safe_name = f"{fid}_{file.filename}"
     path = os.path.join(STORAGE_DIR, safe_name)
-    with open(path, "wb") as f:
-        f.write(await file.read())
+    size_bytes = await run_in_threadpool(persist_upload, file.file, path)
 
     filetype = guess_filetype(file.filename)
-    size_bytes = os.path.getsize(path)
 
     upload_doc = {
         "project_id": project_id,
@@ -125,54 +256,53 @@ async def upload_file(
         "filepath": path,
         "filetype": filetype,
         "size_bytes": size_bytes,
+        "extraction_status": "pending",
     }
-    upload_id = create_document("upload", upload_doc)
-
-    # MVP extraction: scan filename for tag-like strings
-    found_tags = TAG_PATTERN.findall(file.filename.upper())
-    for tag in found_tags:
-        item = {
-            "project_id": project_id,
-            "upload_id": upload_id,
-            "kind": "tag",
-            "label": tag,
-            "attributes": {"source": "filename"},
-            "page": None,
-            "confidence": 0.4,
-        }
-        create_document("extractionitem", item)
+    # PyMongo is blocking; keep the event loop free while Mongo round-trips
+    upload_id = await run_in_threadpool(create_document, "upload", upload_doc)
+
+    # Extraction runs after the response is sent; progress is recorded on the
+    # upload doc as extraction_status (pending -> done | failed)
+    background.add_task(_extract_and_store, path, file.filename, upload_id, project_id)
 
-    return {"upload_id": upload_id, "filetype": filetype, "size": size_bytes}
+    return {"upload_id": upload_id, "filetype": filetype, "size": size_bytes, "status": "accepted"}
 
 
 @app.get("/api/uploads")
-def list_uploads(project_id: Optional[str] = None):
+def list_uploads(
+    project_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=1000),
+):
     filt: Dict[str, Any] = {"project_id": project_id} if project_id else {}
-    items = get_documents("upload", filt, limit=200)
-    for it in items:
-        if "_id" in it:
-            it["_id"] = str(it["_id"])
-    return {"uploads": items}
+    items = get_documents("upload", filt, skip=skip, limit=limit)
+    return ORJSONResponse({"uploads": items})
 
 
 @app.get("/api/extractions")
-def list_extractions(project_id: Optional[str] = None):
+def list_extractions(
+    project_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=1000),
+    include_attributes: bool = True,
+):
     filt: Dict[str, Any] = {"project_id": project_id} if project_id else {}
-    items = get_documents("extractionitem", filt, limit=1000)
-    for it in items:
-        if "_id" in it:
-            it["_id"] = str(it["_id"])
-    return {"items": items}
+    # Clients that only need labels can opt out of the free-form attributes
+    projection = None if include_attributes else {"attributes": 0}
+    items = get_documents("extractionitem", filt, skip=skip, limit=limit, projection=projection)
+    return ORJSONResponse({"items": items})
 
 
 @app.post("/api/documents/generate")
 def generate_document(req: DocumentRequest):
-    # Aggregate extraction items for the project
-    items = get_documents("extractionitem", {"project_id": req.project_id}, limit=5000)
-
     if req.doc_type == "tag-index":
-        tags = sorted({it.get("label") for it in items if it.get("kind") == "tag" and it.get("label")})
-        rows = [{"tag": t} for t in tags]
+        # Distinct tag labels, grouped and sorted server-side
+        groups = aggregate_documents("extractionitem", [
+            {"$match": {"project_id": req.project_id, "kind": "tag", "label": {"$nin": [None, ""]}}},
+            {"$group": {"_id": "$label"}},
+            {"$sort": {"_id": 1}},
+        ])
+        rows = [{"tag": g["_id"]} for g in groups]
         draft = {
             "project_id": req.project_id,
             "doc_type": "tag-index",
@@ -184,12 +314,14 @@ def generate_document(req: DocumentRequest):
         return {"document_id": did, "document": draft}
 
     if req.doc_type == "bom":
-        # naive BOM based on extracted 'bom' kind items (future enhancement)
-        parts: Dict[str, int] = {}
-        for it in items:
-            if it.get("kind") == "bom" and it.get("label"):
-                parts[it["label"]] = parts.get(it["label"], 0) + 1
-        rows = [{"item": k, "qty": v} for k, v in sorted(parts.items())]
+        # naive BOM based on extracted 'bom' kind items (future enhancement);
+        # quantities are counted by $group, so no Python-side tally is needed
+        groups = aggregate_documents("extractionitem", [
+            {"$match": {"project_id": req.project_id, "kind": "bom", "label": {"$nin": [None, ""]}}},
+            {"$group": {"_id": "$label", "qty": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ])
+        rows = [{"item": g["_id"], "qty": g["qty"]} for g in groups]
         draft = {
             "project_id": req.project_id,
             "doc_type": "bom",
@@ -217,4 +349,14 @@ def generate_document(req: DocumentRequest):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # Production alternative: gunicorn -k uvicorn.workers.UvicornWorker -w $((2*NCPU+1)) main:app
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+    )
@@ -23,6 +23,9 @@ class Upload(BaseModel):
     filepath: str = Field(..., description="Server-side path to stored file")
     filetype: str = Field(..., description="Detected type: pdf|dxf|dwg|step|ifc|obj|other")
     size_bytes: int = Field(..., description="File size in bytes")
+    extraction_status: str = Field("pending", description="pending|done|failed")
+    extraction_count: Optional[int] = Field(None, description="Extraction items stored once done")
+    extraction_error: Optional[str] = Field(None, description="Failure reason if extraction failed")
 
 
 class ExtractionItem(BaseModel):